@@ -1,13 +1,31 @@
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
 import datetime
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-import numpy as np
+import functools
+import glob
 import time
 import os
+import sys
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+# Fastest available JSON parser; all three accept bytes
+try:
+    import orjson as _json
+except ImportError:
+    try:
+        import ujson as _json
+    except ImportError:
+        import json as _json
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
 # --- CONFIGURATION ---
 
 load_dotenv()
@@ -24,6 +42,24 @@ BASE_URL = "https://api.etherscan.io/v2/api"
 # Chain ID (1 = Ethereum Mainnet)
 CHAIN_ID = "1"
 
+# Etherscan free tier allows 5 calls/sec, so every attempt (retries included)
+# takes a token from the limiter and only a handful are allowed in flight at
+# once. One session reuses the connection.
+RATE_LIMIT = 5
+MAX_WORKERS = RATE_LIMIT  # more threads would only queue on the limiter
+MAX_RETRIES = 3
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=10))
+
+# Responses are cached in Redis when it is reachable, otherwise in-process.
+REDIS_URL = os.getenv("REDIS_URL", "unix:///tmp/redis.sock")
+CACHE_TTL = 300
+
+# Saved reports younger than this are reused instead of re-running the trace
+REPORT_TTL = 600
+
 # Known "Bad Actors" List
 RISKY_ADDRESSES = {
     "0xd90e2f925da726b50c4ed8d0fb90ad053324f31b": "Tornado Cash Router",
@@ -40,9 +76,74 @@ RISKY_ADDRESSES = {
     "0x7db418b5d567a4e0e8c59ad71be1fce48f3e6107": "OFAC Sanctioned Entity 3",
 }
 
-def get_transactions(address):
-    """Fetches transaction history using the Etherscan V2 API."""
-    time.sleep(0.25)
+# Lowercased views so lookups don't depend on how an address was checksummed
+RISKY_LOWER = {k.lower(): v for k, v in RISKY_ADDRESSES.items()}
+RISKY_SET = frozenset(RISKY_LOWER)
+
+
+class TokenBucket:
+    """Thread-safe rate limiter: refills `rate` tokens/sec, holds up to `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Takes one token, sleeping only if the bucket is empty."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# burst=1: a full bucket would let a second's refill stack on top of it
+LIMITER = TokenBucket(rate=RATE_LIMIT, burst=1)
+
+
+class EtherscanError(Exception):
+    """Raised when Etherscan answers with an error payload."""
+
+
+def _connect_cache():
+    """Returns a Redis client, or None if Redis is missing or unreachable."""
+    if redis is None:
+        return None
+    try:
+        client = redis.Redis.from_url(REDIS_URL, socket_connect_timeout=1)
+        client.ping()
+        return client
+    except redis.RedisError:
+        return None
+
+
+CACHE = _connect_cache()
+
+
+def _cache_get(key):
+    try:
+        return CACHE.get(key)
+    except redis.RedisError:
+        return None
+
+
+def _cache_set(key, transactions):
+    try:
+        CACHE.setex(key, CACHE_TTL, _json.dumps(transactions))
+    except redis.RedisError:
+        pass
+
+
+def _fetch_transactions(address):
+    """Requests an address's txlist from Etherscan, raising on failure."""
     params = {
         "chainid": CHAIN_ID,
         "module": "account",
@@ -54,105 +155,261 @@ def get_transactions(address):
         "apikey": API_KEY
     }
 
-    try:
-        response = requests.get(BASE_URL, params=params)
-        data = response.json()
-
-        if data["message"] != "OK":
-            if "No transactions found" in data["message"]:
-                return []
-            print(f"\n API ERROR: {data['message']}")
-            print(f"   Details: {data.get('result', 'Unknown error')}\n")
+    for attempt in range(MAX_RETRIES + 1):
+        if attempt:
+            time.sleep(0.5 * 2 ** (attempt - 1))
+        last_try = attempt == MAX_RETRIES
+
+        LIMITER.acquire()
+        try:
+            response = SESSION.get(BASE_URL, params=params, timeout=10)
+        except (requests.ConnectionError, requests.Timeout):
+            if last_try:
+                raise
+            continue
+
+        if response.status_code in RETRY_STATUSES and not last_try:
+            continue
+        response.raise_for_status()
+        data = _json.loads(response.content)
+
+        if data["message"] == "OK":
+            return data["result"][:50]
+        if "No transactions found" in data["message"]:
             return []
 
-        return data["result"][:50]
+        # Etherscan reports throttling in the body of a 200 response
+        if "rate limit" not in str(data.get("result", "")).lower() or last_try:
+            raise EtherscanError(data)
+
+
+@functools.lru_cache(maxsize=1024)
+def _fetch_transactions_local(address):
+    return _fetch_transactions(address)
+
+
+def get_transactions(address):
+    """Fetches transaction history using the Etherscan V2 API.
+
+    Returns None instead of a list if the fetch failed, so callers can tell
+    an error apart from an address with no transactions.
+    """
+    try:
+        if CACHE is None:
+            return list(_fetch_transactions_local(address))
+
+        key = f"etx:{CHAIN_ID}:{address.lower()}"
+        cached = _cache_get(key)
+        if cached is not None:
+            return _json.loads(cached)[:50]
+
+        transactions = _fetch_transactions(address)
+        _cache_set(key, transactions)
+        return transactions
+
+    except EtherscanError as e:
+        data = e.args[0]
+        print(f"\n API ERROR: {data['message']}")
+        print(f"   Details: {data.get('result', 'Unknown error')}\n")
+        return None
 
     except Exception as e:
         print(f"Connection error: {e}")
-        return []
+        return None
+
+
+def get_transactions_batch(addresses):
+    """Fetches the history of several addresses concurrently, yielding in input order.
+
+    Results are yielded as soon as they (and those before them) arrive, so
+    callers can analyze one address while the rest are still in flight.
+    """
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(addresses) or 1)) as executor:
+        yield from executor.map(get_transactions, addresses)
+
+
+# Alerts are plain tuples; ALERT_COLUMNS names the same fields for DataFrames
+ALERT_COLUMNS = ["Date", "Risk Type", "Entity", "Amount", "Hop"]
+Alert = namedtuple("Alert", ["date", "risk_type", "entity", "amount", "hop"])
+
+WEI_PER_ETH = 10**18
+LAYERING_THRESHOLD_WEI = 2 * WEI_PER_ETH
 
 
 def analyze_risk(transactions, current_address, depth=0):
     """Analyze transactions for risk indicators at a given hop depth."""
     alerts = []
-    suspicious_destinations = []
+    suspicious_destinations = {}  # dict keeps first-seen order while deduplicating
+    current_address = current_address.lower()
 
     print(f"   [Depth {depth}] Scanning {len(transactions)} txs...")
 
     for tx in transactions:
-        eth_value = float(tx["value"]) / 10**18
-        tx_date = datetime.datetime.fromtimestamp(int(tx["timeStamp"]))
+        to_addr = tx["to"].lower()
+        from_addr = tx["from"].lower()
 
         # CHECK 1: Direct Exposure to known bad actors
-        if tx["to"] in RISKY_ADDRESSES:
-            alerts.append({
-                "Date": tx_date,
-                "Risk Type": "Direct Interaction",
-                "Entity": RISKY_ADDRESSES[tx["to"]],
-                "Amount": eth_value,
-                "Hop": depth
-            })
-
-        if tx["from"] in RISKY_ADDRESSES:
-            alerts.append({
-                "Date": tx_date,
-                "Risk Type": "Direct Interaction",
-                "Entity": f"Inflow from {RISKY_ADDRESSES[tx['from']]}",
-                "Amount": eth_value,
-                "Hop": depth
-            })
+        to_risky = to_addr in RISKY_SET
+        from_risky = from_addr in RISKY_SET
 
         # CHECK 2: Follow the Money (Outgoing > 2 ETH to unknown wallets)
-        if depth == 0 and tx["from"].lower() == current_address.lower() and eth_value > 2:
-            if tx["to"] not in RISKY_ADDRESSES:
-                suspicious_destinations.append(tx["to"])
-                alerts.append({
-                    "Date": tx_date,
-                    "Risk Type": "Potential Layering (Outgoing)",
-                    "Entity": f"Suspect Wallet -> {tx['to'][:10]}...",
-                    "Amount": eth_value,
-                    "Hop": depth
-                })
-
-    return alerts, list(set(suspicious_destinations))
-
-
-def trace_money_trail(target_address):
-    """Two-phase investigation: scan target, then follow suspicious outflows."""
+        layering = (
+            depth == 0
+            and not to_risky
+            and from_addr == current_address
+            and int(tx["value"]) > LAYERING_THRESHOLD_WEI
+        )
+
+        if not (to_risky or from_risky or layering):
+            continue
+
+        # Amount and date are only needed for the rare rows that alert
+        eth_value = float(tx["value"]) / WEI_PER_ETH
+        tx_date = datetime.datetime.fromtimestamp(int(tx["timeStamp"]))
+
+        if to_risky:
+            alerts.append(Alert(tx_date, "Direct Interaction", RISKY_LOWER[to_addr], eth_value, depth))
+
+        if from_risky:
+            alerts.append(Alert(tx_date, "Direct Interaction", f"Inflow from {RISKY_LOWER[from_addr]}", eth_value, depth))
+
+        if layering:
+            suspicious_destinations[to_addr] = None
+            alerts.append(Alert(tx_date, "Potential Layering (Outgoing)", f"Suspect Wallet -> {to_addr[:10]}...", eth_value, depth))
+
+    # Never spend an API call on an address we already have a label for, or on
+    # the empty "to" of a contract creation
+    return alerts, [a for a in suspicious_destinations if a and a not in RISKY_LOWER]
+
+
+def _load_recent_report(address):
+    """Alerts from the newest saved report for `address`, or None if stale or missing."""
+    paths = glob.glob(f"report_{address.lower()}_*.parquet")
+    if not paths:
+        return None
+
+    # The saved report is only a cache: no parquet engine, a file removed
+    # underneath us or a corrupt file all just mean a fresh trace
+    try:
+        path = max(paths, key=os.path.getmtime)
+        if time.time() - os.path.getmtime(path) > REPORT_TTL:
+            return None
+        df = pd.read_parquet(path)
+        alerts = list(map(Alert._make, df[ALERT_COLUMNS].itertuples(index=False, name=None)))
+    except Exception:
+        return None
+
+    print(f"\n Reusing saved report {path}")
+    return alerts
+
+
+def _save_report(address, alerts):
+    """Persists alerts to parquet so a rerun within REPORT_TTL can skip the API."""
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = f"report_{address.lower()}_{timestamp}.parquet"
+    tmp_path = f"{path}.tmp"  # doesn't match the glob, so never read half-written
+
+    try:
+        pd.DataFrame(alerts, columns=ALERT_COLUMNS).to_parquet(tmp_path, compression="snappy")
+        os.replace(tmp_path, path)
+    except Exception:
+        # Best effort, like loading: a failed save only costs the next run a trace
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def trace_money_trail(target_address, refresh=False):
+    """Two-phase investigation: scan target, then follow suspicious outflows.
+
+    A report saved within REPORT_TTL is reused unless `refresh` is set.
+    """
+    if not refresh:
+        saved_alerts = _load_recent_report(target_address)
+        if saved_alerts is not None:
+            return saved_alerts
+
     print(f"\n PHASE 1: Analyzing Target {target_address}...")
     target_txs = get_transactions(target_address)
+    complete = target_txs is not None  # only complete traces are worth saving
 
-    primary_alerts, potential_mules = analyze_risk(target_txs, target_address, depth=0)
+    primary_alerts, potential_mules = analyze_risk(target_txs or [], target_address, depth=0)
     all_alerts = primary_alerts
 
     # PHASE 2: Check the downstream wallets
     if potential_mules:
         print(f"\n PHASE 2: Following the money ({len(potential_mules)} destinations)...")
-        for mule_address in potential_mules[:10]:  # cap at 10 to avoid rate limits
-            mule_txs = get_transactions(mule_address)
+        mules = potential_mules[:10]  # cap at 10 most recent destinations to bound API calls
+        for mule_address, mule_txs in zip(mules, get_transactions_batch(mules)):
+            if mule_txs is None:
+                complete = False
+                continue
             mule_alerts, _ = analyze_risk(mule_txs, mule_address, depth=1)
 
             if mule_alerts:
                 print(f"   HIDDEN RISK FOUND in {mule_address}")
-                for alert in mule_alerts:
-                    alert["Risk Type"] = "Indirect Connection (Layering)"
-                    alert["Entity"] = f"{alert['Entity']} (via {mule_address[:10]})"
-                    all_alerts.append(alert)
-
+                all_alerts.extend(
+                    alert._replace(
+                        risk_type="Indirect Connection (Layering)",
+                        entity=f"{alert.entity} (via {mule_address[:10]})",
+                    )
+                    for alert in mule_alerts
+                )
+
+    if complete:
+        _save_report(target_address, all_alerts)
     return all_alerts
 
 
-def compute_risk_score(df):
-    """Compute a 0-100 risk score from alert data."""
-    direct = len(df[df['Risk Type'] == 'Direct Interaction'])
-    indirect = len(df[df['Risk Type'] == 'Indirect Connection (Layering)'])
-    layering = len(df[df['Risk Type'] == 'Potential Layering (Outgoing)'])
-    total_eth = df['Amount'].sum()
+def compute_risk_score(counts, total_eth):
+    """Compute a 0-100 risk score from per-risk-type alert counts and total ETH."""
+    direct = counts.get('Direct Interaction', 0)
+    indirect = counts.get('Indirect Connection (Layering)', 0)
+    layering = counts.get('Potential Layering (Outgoing)', 0)
 
     score = min(100, (direct * 25) + (indirect * 15) + (layering * 5) + int(total_eth * 0.5))
     return score
 
 
+def _summarize_alerts(alerts, df):
+    """Risk-type counts, total ETH, per-entity ETH volume and the top 3 alerts.
+
+    Aggregates with Polars when it is installed. Results come back as small
+    pandas Series and plain records either way, which is all matplotlib needs.
+    """
+    # Deferred like matplotlib: only runs that produce a report pay for it
+    try:
+        import polars as pl
+    except ImportError:
+        pl = None
+
+    if pl is None:
+        return (
+            df['Risk Type'].value_counts(),
+            df['Amount'].sum(),
+            df.groupby('Entity', sort=False)['Amount'].sum(),
+            df.nlargest(3, 'Amount').to_dict('records'),
+        )
+
+    pdf = pl.DataFrame(alerts, schema=ALERT_COLUMNS, orient="row")
+    counts = pdf['Risk Type'].value_counts(sort=True)
+    entity_vol = pdf.group_by('Entity', maintain_order=True).agg(pl.col('Amount').sum())
+    return (
+        pd.Series(counts['count'].to_list(), index=counts['Risk Type'].to_list()),
+        pdf['Amount'].sum(),
+        pd.Series(entity_vol['Amount'].to_list(), index=entity_vol['Entity'].to_list()),
+        pdf.top_k(3, by='Amount').rows(named=True),
+    )
+
+
+def _can_show_plots():
+    """True when a plot window could actually be displayed to a user."""
+    if not sys.stdout.isatty():
+        return False
+    if os.name == "nt" or sys.platform == "darwin":
+        return True
+    return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+
 def visualize_investigation(alerts):
     """
     Generate a multi-panel investigation report.
@@ -162,7 +419,20 @@ def visualize_investigation(alerts):
         print("No alerts to visualize.")
         return
 
-    df = pd.DataFrame(alerts)
+    # Deferred so clean runs never pay for the matplotlib import. Headless
+    # runs get the non-interactive Agg backend and skip the GUI entirely.
+    interactive = _can_show_plots()
+    import matplotlib
+    if not interactive:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+
+    df = pd.DataFrame(alerts, columns=ALERT_COLUMNS)
+
+    # Aggregate once up front; the panels and the risk score all reuse these
+    risk_counts, total_eth, entity_vol, top3 = _summarize_alerts(alerts, df)
+    counts = risk_counts.to_dict()
 
     colors = {
         'Direct Interaction': '#e74c3c',
@@ -186,8 +456,7 @@ def visualize_investigation(alerts):
     axes[0, 0].set_visible(False)
     axes[0, 1].set_visible(False)
 
-    for r_type in df['Risk Type'].unique():
-        subset = df[df['Risk Type'] == r_type]
+    for r_type, subset in df.groupby('Risk Type', sort=False):
         ax_timeline.scatter(
             subset['Date'], subset['Amount'],
             label=r_type, color=colors.get(r_type, 'gray'),
@@ -195,8 +464,7 @@ def visualize_investigation(alerts):
         )
 
     # Annotate top 3 highest-value events
-    top3 = df.nlargest(3, 'Amount')
-    for _, row in top3.iterrows():
+    for row in top3:
         ax_timeline.annotate(
             f"{row['Amount']:.2f} ETH\n{row['Entity'][:25]}",
             xy=(row['Date'], row['Amount']),
@@ -215,7 +483,6 @@ def visualize_investigation(alerts):
 
     # ── Panel 2: Risk Type Distribution (middle-left) ──
     ax_bar = axes[1, 0]
-    risk_counts = df['Risk Type'].value_counts()
     bar_colors = [colors.get(rt, 'gray') for rt in risk_counts.index]
     bars = ax_bar.barh(risk_counts.index, risk_counts.values, color=bar_colors, edgecolor='black', linewidth=0.8)
 
@@ -229,13 +496,13 @@ def visualize_investigation(alerts):
 
     # ── Panel 3: ETH Volume by Entity (middle-right) ──
     ax_entity = axes[1, 1]
-    entity_vol = df.groupby('Entity')['Amount'].sum().sort_values(ascending=True).tail(8)
+    top_entities = entity_vol.sort_values(ascending=True).tail(8)
     entity_colors = ['#e74c3c' if any(k in ent for k in ['Tornado', 'Exploit', 'OFAC', 'Phish']) else '#3498db'
-                     for ent in entity_vol.index]
-    short_labels = [e[:30] + '...' if len(e) > 30 else e for e in entity_vol.index]
-    ax_entity.barh(short_labels, entity_vol.values, color=entity_colors, edgecolor='black', linewidth=0.8)
+                     for ent in top_entities.index]
+    short_labels = [e[:30] + '...' if len(e) > 30 else e for e in top_entities.index]
+    ax_entity.barh(short_labels, top_entities.values, color=entity_colors, edgecolor='black', linewidth=0.8)
 
-    for i, val in enumerate(entity_vol.values):
+    for i, val in enumerate(top_entities.values):
         ax_entity.text(val + 0.1, i, f"{val:.2f}", va='center', fontsize=9, fontweight='bold')
 
     ax_entity.set_title('ETH Volume by Entity (Top 8)', fontsize=13, fontweight='bold', pad=10)
@@ -245,17 +512,16 @@ def visualize_investigation(alerts):
     ax_summary = axes[2, 0]
     ax_summary.axis('off')
 
-    direct_n = len(df[df['Risk Type'] == 'Direct Interaction'])
-    indirect_n = len(df[df['Risk Type'] == 'Indirect Connection (Layering)'])
-    total_eth = df['Amount'].sum()
-    risk_score = compute_risk_score(df)
+    direct_n = counts.get('Direct Interaction', 0)
+    indirect_n = counts.get('Indirect Connection (Layering)', 0)
+    risk_score = compute_risk_score(counts, total_eth)
 
     summary_lines = [
         f"Total Alerts:            {len(df)}",
         f"Direct Interactions:     {direct_n}",
         f"Indirect Connections:    {indirect_n}",
         f"Total ETH Flagged:       {total_eth:.4f}",
-        f"Unique Entities:         {df['Entity'].nunique()}",
+        f"Unique Entities:         {len(entity_vol)}",
     ]
     summary_text = "\n".join(summary_lines)
     ax_summary.text(
@@ -294,7 +560,9 @@ def visualize_investigation(alerts):
     filename = f"investigation_report_{timestamp}.png"
     fig.savefig(filename, dpi=200, facecolor='white')
     print(f"\n Report saved as: {filename}")
-    plt.show()
+    if interactive:
+        plt.show()
+    plt.close(fig)
 
 
 # --- MAIN EXECUTION ---
@@ -303,13 +571,13 @@ if __name__ == "__main__":
     user_input = input("Enter Target Address: ").strip().lower()
 
     if user_input.startswith("0x") and len(user_input) == 42:
-        report = trace_money_trail(user_input)
+        report = trace_money_trail(user_input, refresh="--fresh" in sys.argv[1:])
         if report:
             print("\n" + "=" * 50)
             print(" FINAL REPORT")
             print("=" * 50)
             for alert in report:
-                print(f"  {alert['Risk Type']} | {alert['Amount']:.4f} ETH | {alert['Entity']}")
+                print(f"  {alert.risk_type} | {alert.amount:.4f} ETH | {alert.entity}")
             visualize_investigation(report)
         else:
             print(" No suspicious trails found.")